@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from . import browsers, generic, utils  # noqa: F401
 
 __version__ = "0.4.1"
@@ -14,17 +16,26 @@ def get_history():
     :rtype: :py:class:`browser_history.generic.Outputs`
     """
     output_object = generic.Outputs(fetch_type="history")
-    browser_classes = utils.get_browsers()
-    for browser_class in browser_classes:
+    browser_objects = []
+    for browser_class in utils.get_browsers():
         try:
-            browser_object = browser_class()
-            browser_output_object = browser_object.fetch_history()
-            output_object.histories.extend(browser_output_object.histories)
+            browser_objects.append(browser_class())
         except AssertionError:
             utils.logger.info("%s browser is not supported", browser_class.name)
-    # Can't sort tuples with None values, and some titles
-    # are None, so replace them with ''
-    output_object.histories.sort(key=lambda h: tuple(el or "" for el in h))
+
+    def fetch(browser_object):
+        return browser_object.fetch_history().histories
+
+    if len(browser_objects) > 1:
+        # browsers are read in parallel for the same reason their profiles
+        # are, see generic.Browser.fetch_history
+        with ThreadPoolExecutor(min(8, len(browser_objects))) as executor:
+            for histories in executor.map(fetch, browser_objects):
+                output_object.histories.extend(histories)
+    else:
+        for browser_object in browser_objects:
+            output_object.histories.extend(fetch(browser_object))
+    output_object.histories.sort(key=generic._history_sort_key)
     return output_object
 
 
@@ -3,10 +3,9 @@
 All browsers must inherit from :py:mod:`browser_history.generic.Browser`.
 """
 
-import datetime
 import sqlite3
 
-from browser_history.generic import Browser, ChromiumBasedBrowser
+from browser_history.generic import Browser, ChromiumBasedBrowser, _parse_sqlite_ts
 
 
 class Chromium(ChromiumBasedBrowser):
@@ -77,9 +76,7 @@ class Firefox(Browser):
 
     history_SQL = """
         SELECT
-            datetime(
-                visit_date/1000000, 'unixepoch', 'localtime'
-            ) AS 'visit_time',
+            visit_date/1000000 AS 'visit_time',
             url,
             moz_places.title
         FROM
@@ -123,9 +120,7 @@ class Firefox(Browser):
         cursor.execute(bookmarks_sql)
         date_bookmarks = [
             (
-                datetime.datetime.strptime(d, "%Y-%m-%d %H:%M:%S").replace(
-                    tzinfo=self._local_tz
-                ),
+                _parse_sqlite_ts(d, self._local_tz),
                 url,
                 title,
                 folder,
@@ -173,9 +168,7 @@ class Safari(Browser):
 
     history_SQL = """
         SELECT
-            datetime(
-                visit_time + 978307200, 'unixepoch', 'localtime'
-            ) as visit_time,
+            CAST(visit_time + 978307200 AS INTEGER) as visit_time,
             url,
             title
         FROM
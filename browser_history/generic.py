@@ -7,14 +7,17 @@ All browsers from :py:mod:`browser_history.browsers` inherit this class.
 import abc
 import csv
 import datetime
+import fnmatch
 import json
 import os
+import re
 import shutil
 import sqlite3
 import tempfile
 import typing
 import warnings
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from io import StringIO
 from pathlib import Path
@@ -26,6 +29,147 @@ import browser_history.utils as utils
 HistoryVar = List[Tuple[datetime.datetime, str]]
 BookmarkVar = List[Tuple[datetime.datetime, str, str, str]]
 
+_SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+"""Bytes of a history file SQLite may memory-map while reading it."""
+
+# scheme and netloc of plain ``scheme://netloc/...`` URLs. Anything urlparse
+# would treat specially (tabs or newlines, brackets of IPv6 hosts, non-ASCII
+# hosts, leading whitespace) does not match.
+_NETLOC_RE = re.compile(
+    r"[A-Za-z][A-Za-z0-9+.-]*://([^/?#\[\]\t\r\n\x80-\U0010ffff]*)(?=[/?#]|\Z)"
+)
+
+
+def _parse_sqlite_ts(
+    timestamp: str, tz: typing.Optional[datetime.tzinfo] = None
+) -> datetime.datetime:
+    """Parses a ``YYYY-MM-DD HH:MM:SS`` string returned by SQLite's
+    ``datetime`` function into a datetime with ``tz`` as its timezone.
+
+    The format is fixed, so slicing the fields out is much faster than
+    :py:meth:`datetime.datetime.strptime`, which matters when parsing every
+    row of a large history.
+    """
+    return datetime.datetime(
+        int(timestamp[0:4]),
+        int(timestamp[5:7]),
+        int(timestamp[8:10]),
+        int(timestamp[11:13]),
+        int(timestamp[14:16]),
+        int(timestamp[17:19]),
+        tzinfo=tz,
+    )
+
+
+def _visit_time_to_datetime(
+    visit_time: typing.Union[int, float, str],
+    tz: typing.Optional[datetime.tzinfo] = None,
+) -> datetime.datetime:
+    """Converts a ``visit_time`` returned by a history query into a datetime
+    with ``tz`` as its timezone.
+
+    ``visit_time`` is either a Unix timestamp or a string returned by SQLite's
+    ``datetime`` function with the ``localtime`` modifier. Both give the same
+    local wall clock time, but timestamps are converted in C without SQLite
+    having to format a string that is then parsed again.
+    """
+    if isinstance(visit_time, str):
+        return _parse_sqlite_ts(visit_time, tz)
+    return datetime.datetime.fromtimestamp(visit_time).replace(tzinfo=tz)
+
+
+def _netloc(url: str) -> str:
+    """Returns the same netloc as ``urlparse(url).netloc``.
+
+    Common URLs are matched with a regular expression, which is several times
+    faster than parsing the whole URL. Others are left to ``urlparse``.
+    """
+    match = _NETLOC_RE.match(url)
+    if match is None:
+        return urlparse(url).netloc
+    return match.group(1)
+
+
+def _is_nonempty_file(path) -> bool:
+    """Checks whether ``path`` exists and is not empty, with a single stat."""
+    try:
+        return os.stat(path).st_size > 0
+    except OSError:
+        # missing, like os.path.exists returning False
+        return False
+
+
+def _webkit_to_datetime(
+    timestamp: typing.Union[int, str], tz: typing.Optional[datetime.tzinfo]
+) -> datetime.datetime:
+    """Converts a WebKit timestamp (microseconds since 1601-01-01 UTC), as
+    used by Chromium, into a datetime in ``tz`` truncated to whole seconds."""
+    seconds = int(timestamp) // 1000000 - 11644473600
+    if seconds >= 0:
+        return datetime.datetime.fromtimestamp(seconds, tz)
+    # fromtimestamp fails for times before 1970 on some platforms (Windows)
+    return (
+        datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+        + datetime.timedelta(seconds=seconds)
+    ).astimezone(tz)
+
+
+def _history_sort_key(history: Tuple[datetime.datetime, str, str]) -> tuple:
+    """Sort key for history entries.
+
+    Can't sort tuples with None values, and some titles are None, so replace
+    them with ''.
+    """
+    timestamp, url, title = history
+    return (timestamp, url or "", title or "")
+
+
+def _sqlite_snapshot(db_path) -> typing.Optional[sqlite3.Connection]:
+    """Returns a connection to a snapshot of the SQLite database at ``db_path``,
+    or :py:class:`None` if the database is empty.
+
+    The snapshot is taken in memory with SQLite's online backup API, which
+    only reads the pages in use, so the history file does not have to be
+    copied on disk first. The source is opened as ``immutable``: SQLite then
+    neither waits on nor takes any lock, and creates no ``-wal``/``-shm``
+    files next to it, so a running browser is not disturbed. If the database
+    cannot be read in place, the file and its ``-wal`` file are copied to a
+    temporary directory and the snapshot is taken from the copy instead.
+
+    Files are read through memory-mapped I/O, and the query's sorts are kept
+    in memory instead of temporary files.
+    """
+    snapshot = sqlite3.connect(":memory:")
+    try:
+        source = sqlite3.connect(
+            f"{Path(db_path).absolute().as_uri()}?mode=ro&immutable=1", uri=True
+        )
+        try:
+            source.execute(f"PRAGMA mmap_size={_SQLITE_MMAP_SIZE}")
+            # surface unreadable files here, before handing them to backup()
+            source.execute("SELECT 1 FROM sqlite_master")
+            source.backup(snapshot)
+        finally:
+            source.close()
+    except sqlite3.Error:
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            copied_path = shutil.copy2(db_path, tmpdirname)
+            if os.path.exists(f"{db_path}-wal"):
+                shutil.copy2(f"{db_path}-wal", tmpdirname)
+            # opened normally, so that changes still in the -wal file are read
+            source = sqlite3.connect(copied_path)
+            try:
+                source.execute(f"PRAGMA mmap_size={_SQLITE_MMAP_SIZE}")
+                source.backup(snapshot)
+            finally:
+                source.close()
+    # empty files are valid, empty databases
+    if snapshot.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone() is None:
+        snapshot.close()
+        return None
+    snapshot.execute("PRAGMA temp_store=MEMORY")
+    return snapshot
+
 
 class Browser(abc.ABC):
     """A generic class to support all major browsers with minimal
@@ -70,8 +214,9 @@ class Browser(abc.ABC):
     ...     \"\"\"
     ...     linux_path = 'browser'
     ...
-    ... vars(CustomBrowser())
-    {'profile_dir_prefixes': [], 'history_dir': PosixPath('/home/username/browser')}
+    ... browser = CustomBrowser()
+    ... browser.profile_dir_prefixes, browser.history_dir
+    ([], PosixPath('/home/username/browser'))
     """
 
     windows_path: typing.Optional[str] = None  #: browser path on Windows.
@@ -89,10 +234,10 @@ class Browser(abc.ABC):
     bookmarks_file: typing.Optional[str] = None
     """Name of the (SQLite, JSON or PLIST) file which stores the bookmarks."""
 
-    _local_tz: typing.Optional[datetime.tzinfo] = (
-        datetime.datetime.now().astimezone().tzinfo
-    )
-    """Gets a datetime object of the current time as per the users timezone."""
+    _local_tz: typing.Optional[datetime.tzinfo] = None
+    """Timezone set on the returned datetimes. If left as :py:class:`None`, the
+    user's timezone at the time the browser object is created is used, so
+    setting it to :py:class:`None` does not give naive datetimes."""
 
     history_dir: Path
     """History directory."""
@@ -118,14 +263,17 @@ class Browser(abc.ABC):
     def history_SQL(self) -> str:
         """SQL query required to extract history from the ``history_file``.
         The query must return three columns: ``visit_time``, ``url`` and ``title``.
-        The ``visit_time`` must be processed using the `datetime`_
-        function with the modifier ``localtime``.
+        The ``visit_time`` should be a Unix timestamp in seconds. A string
+        processed using the `datetime`_ function with the modifier
+        ``localtime`` is also accepted.
 
             .. _datetime: https://www.sqlitetutorial.net/sqlite-date-functions/sqlite-datetime-function/
         """  # pylint: disable=line-too-long # noqa: E501
 
     def __init__(self, plat: typing.Optional[utils.Platform] = None):
-        self.profile_dir_prefixes = []
+        # copied so that appending to it does not change the class attribute,
+        # and without duplicates, which would only be matched twice
+        self.profile_dir_prefixes = list(dict.fromkeys(self.profile_dir_prefixes or []))
         if plat is None:
             plat = utils.get_platform()
         homedir = Path.home()
@@ -145,9 +293,17 @@ class Browser(abc.ABC):
         else:
             raise NotImplementedError()
 
+        if self._local_tz is None:
+            # resolved per instance rather than once at import so that a
+            # long-running process picks up timezone or DST changes
+            self._local_tz = datetime.datetime.now().astimezone().tzinfo
+
         if self.profile_support and not self.profile_dir_prefixes:
             self.profile_dir_prefixes.append("*")
 
+        # profiles found by profiles(), see invalidate_profiles_cache()
+        self._profiles_cache: Dict[tuple, Tuple[int, List[str]]] = {}
+
     def bookmarks_parser(
         self, bookmark_path
     ):  # pylint: disable=assignment-from-no-return
@@ -158,6 +314,11 @@ class Browser(abc.ABC):
         on the current
         platform but is not installed an empty list will be returned
 
+        The profile directories found are remembered by the browser object
+        until an entry is added to or removed from the browser directory
+        itself. Profiles created deeper than that are only found after calling
+        :py:meth:`invalidate_profiles_cache`.
+
         :param profile_file: file to search for in the profile directories.
             This should be either ``history_file`` or ``bookmarks_file``.
         :type profile_file: str
@@ -165,22 +326,100 @@ class Browser(abc.ABC):
 
         """
 
-        if not os.path.exists(self.history_dir):
+        try:
+            # a single stat tells whether the browser is installed and whether
+            # the cached profiles are still up to date
+            mtime = os.stat(self.history_dir).st_mtime_ns
+        except OSError:
             utils.logger.info("%s browser is not installed", self.name)
             return []
-        if not self.profile_support:
-            return ["."]
+        key = (str(self.history_dir), profile_file, tuple(self.profile_dir_prefixes))
+        cached = self._profiles_cache.get(key)
+        if cached is None or cached[0] != mtime:
+            if not self.profile_support:
+                cached = (mtime, ["."])
+            else:
+                cached = (mtime, self._find_profiles(profile_file))
+            self._profiles_cache[key] = cached
+        # copied so that changes made by the caller do not end up in the cache
+        return list(cached[1])
+
+    def invalidate_profiles_cache(self):
+        """Forgets the profile directories found by :py:meth:`profiles`, so
+        that they are searched for again on the next call."""
+        self._profiles_cache.clear()
+
+    def _find_profiles(self, profile_file: str) -> typing.List[str]:
+        """Searches ``history_dir`` for the profile directories containing
+        ``profile_file``.
+
+        Profiles usually sit directly in ``history_dir``, so that level is
+        checked first. The whole tree below it is only walked if no profile
+        is found there and any directory name may be a profile (``"*"`` in
+        :py:attr:`profile_dir_prefixes`). This keeps the walk out of the
+        large cache directories inside each profile.
+        """
+        history_dir = str(self.history_dir)
+        is_profile_dir_name = self._profile_dir_regex().match
         profile_dirs = []
-        for files in os.walk(str(self.history_dir)):
-            for item in files[2]:
-                if os.path.split(os.path.join(files[0], item))[-1] == profile_file:
-                    path = str(files[0]).split(str(self.history_dir), maxsplit=1)[-1]
-                    if path.startswith(os.sep):
-                        path = path[1:]
-                    if path.endswith(os.sep):
-                        path = path[:-1]
-                    profile_dirs.append(path)
-        return profile_dirs
+        if os.path.isfile(os.path.join(history_dir, profile_file)):
+            profile_dirs.append("")
+        with os.scandir(history_dir) as entries:
+            for entry in entries:
+                if (
+                    entry.is_dir(follow_symlinks=False)
+                    and is_profile_dir_name(entry.name)
+                    and os.path.isfile(os.path.join(entry.path, profile_file))
+                ):
+                    profile_dirs.append(entry.name)
+        if profile_dirs or "*" not in self.profile_dir_prefixes:
+            return profile_dirs
+        return list(self._walk_profiles(history_dir, profile_file, is_profile_dir_name))
+
+    def _profile_dir_regex(self) -> typing.Pattern:
+        """Compiles :py:attr:`profile_dir_prefixes` into a single regular
+        expression matching the names of possible profile directories."""
+        return re.compile(
+            "|".join(fnmatch.translate(prefix) for prefix in self.profile_dir_prefixes)
+        )
+
+    def _walk_profiles(
+        self,
+        history_dir: str,
+        profile_file: str,
+        is_profile_dir_name: Callable[[str], Any],
+    ) -> typing.Iterator[str]:
+        """Yields the directories below ``history_dir`` (relative to it, with
+        ``""`` for ``history_dir`` itself) which contain ``profile_file``.
+
+        Only subdirectories whose names pass ``is_profile_dir_name`` (see
+        :py:meth:`_profile_dir_regex`) are searched, which skips cache
+        directories that can hold many files.
+        """
+        # depth-first with an explicit stack; subdirectories are pushed in
+        # reverse so that they are visited in the order scandir lists them
+        stack = [(history_dir, "")]
+        while stack:
+            directory, profile_dir = stack.pop()
+            subdirs = []
+            found = False
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if is_profile_dir_name(entry.name):
+                                subdirs.append(entry)
+                        elif entry.name == profile_file and entry.is_file():
+                            found = True
+            except OSError:
+                # unreadable directories are skipped, like os.walk does
+                continue
+            if found:
+                yield profile_dir
+            stack.extend(
+                (entry.path, os.path.join(profile_dir, entry.name))
+                for entry in reversed(subdirs)
+            )
 
     def history_path_profile(self, profile_dir: Path) -> typing.Optional[Path]:
         """Returns path of the history file for the given ``profile_dir``
@@ -244,10 +483,11 @@ class Browser(abc.ABC):
         The returned datetimes are timezone-aware with the local timezone set
         by default.
 
-        The history files are first copied to a temporary location and then
-        queried, this might lead to some additional overhead and results
-        returned might not be the latest if the browser is in use. This is
-        done because the SQlite files are locked by the browser when in use.
+        The history files are first copied into memory with SQLite's backup
+        API and then queried, without waiting on the lock held by a browser in
+        use. Results returned might not be the latest if the browser is in
+        use, since changes it has not yet written to the main database file
+        are not read.
 
         :param history_paths: (optional) a list of history files.
         :type history_paths: list(:py:class:`pathlib.Path`)
@@ -265,37 +505,38 @@ class Browser(abc.ABC):
         """
         if history_paths is None:
             history_paths = self.paths(profile_file=self.history_file)
+        history_paths = list(history_paths)
         output_object = Outputs(fetch_type="history")
-        with tempfile.TemporaryDirectory() as tmpdirname:
+        if len(history_paths) > 1:
+            # profiles are independent and sqlite3 releases the GIL while it
+            # reads and queries them, so they are read in parallel
+            with ThreadPoolExecutor(min(8, len(history_paths))) as executor:
+                for histories in executor.map(self._read_history, history_paths):
+                    output_object.histories.extend(histories)
+        else:
             for history_path in history_paths:
-                if os.path.getsize(history_path.absolute()) == 0:
-                    continue
-                copied_history_path = shutil.copy2(history_path.absolute(), tmpdirname)
-                conn = sqlite3.connect(
-                    f"file:{copied_history_path}?mode=ro&immutable=1&nolock=1", uri=True
-                )
-                cursor = conn.cursor()
-                cursor.execute(self.history_SQL)
-                date_histories = [
-                    (
-                        datetime.datetime.strptime(d, "%Y-%m-%d %H:%M:%S").replace(
-                            tzinfo=self._local_tz
-                        ),
-                        url,
-                        title,
-                    )
-                    for d, url, title in cursor.fetchall()
-                ]
-                output_object.histories.extend(date_histories)
-                if sort:
-                    # Can't sort tuples with None values, and some titles
-                    # are None, so replace them with ''
-                    output_object.histories.sort(
-                        key=lambda h: tuple(el or "" for el in h), reverse=desc
-                    )
-                conn.close()
+                output_object.histories.extend(self._read_history(history_path))
+        if sort:
+            # Sort once after all profiles are read.
+            output_object.histories.sort(key=_history_sort_key, reverse=desc)
         return output_object
 
+    def _read_history(self, history_path: Path) -> HistoryVar:
+        """Returns the history stored in a single history file."""
+        conn = _sqlite_snapshot(history_path)
+        if conn is None:
+            return []
+        local_tz = self._local_tz
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.history_SQL)
+            return [
+                (_visit_time_to_datetime(d, local_tz), url, title)
+                for d, url, title in cursor
+            ]
+        finally:
+            conn.close()
+
     def fetch_bookmarks(self, bookmarks_paths=None, sort=True, desc=False):
         """Returns bookmarks of all available profiles stored in SQL or JSON
         or plist.
@@ -328,20 +569,18 @@ class Browser(abc.ABC):
         if bookmarks_paths is None:
             bookmarks_paths = self.paths(profile_file=self.bookmarks_file)
         output_object = Outputs(fetch_type="bookmarks")
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            for bookmarks_path in bookmarks_paths:
-                if not os.path.exists(bookmarks_path):
-                    continue
-                if os.path.getsize(bookmarks_path.absolute()) == 0:
-                    continue
-                copied_bookmark_path = shutil.copy2(
-                    bookmarks_path.absolute(), tmpdirname
-                )
-                # pylint: disable=assignment-from-no-return
-                date_bookmarks = self.bookmarks_parser(copied_bookmark_path)
-                output_object.bookmarks.extend(date_bookmarks)
-            if sort:
-                output_object.bookmarks.sort(reverse=desc)
+        bookmarks_paths = [path for path in bookmarks_paths if _is_nonempty_file(path)]
+        # no temporary directory is needed if there is nothing to copy, which
+        # is the case for every browser that is not installed
+        if bookmarks_paths:
+            with tempfile.TemporaryDirectory() as tmpdirname:
+                for bookmarks_path in bookmarks_paths:
+                    copied_bookmark_path = shutil.copy2(bookmarks_path, tmpdirname)
+                    # pylint: disable=assignment-from-no-return
+                    date_bookmarks = self.bookmarks_parser(copied_bookmark_path)
+                    output_object.bookmarks.extend(date_bookmarks)
+        if sort:
+            output_object.bookmarks.sort(reverse=desc)
         return output_object
 
     @classmethod
@@ -376,17 +615,23 @@ class Outputs:
 
     _valid_fetch_types = ("history", "bookmarks")
 
-    format_map: Dict[str, Callable]
-    """Dictionary which maps output formats to their respective functions."""
-
     def __init__(self, fetch_type):
         self.fetch_type = fetch_type
         self.histories = []
         self.bookmarks = []
-        self.format_map = {
-            "csv": self.to_csv,
-            "json": self.to_json,
-            "jsonl": partial(self.to_json, json_lines=True),
+        # maps output formats to functions writing them to a file object
+        self._writer_map: Dict[str, Callable] = {
+            "csv": self._write_csv,
+            "json": self._write_json,
+            "jsonl": partial(self._write_json, json_lines=True),
+        }
+
+    @property
+    def format_map(self) -> Dict[str, Callable]:
+        """Dictionary which maps output formats to their respective functions."""
+        return {
+            output_format: partial(self.formatted, output_format)
+            for output_format in self._writer_map
         }
 
     @property
@@ -470,10 +715,46 @@ class Outputs:
          })
         """
         domain_histories: typing.DefaultDict[typing.Any, List[Any]] = defaultdict(list)
+        # the same URL is usually visited many times, so each one is parsed once
+        netlocs: Dict[str, str] = {}
         for entry in self._get_data():
-            domain_histories[urlparse(entry[1]).netloc].append(entry)
+            url = entry[1]
+            netloc = netlocs.get(url)
+            if netloc is None:
+                netloc = netlocs[url] = _netloc(url)
+            domain_histories[netloc].append(entry)
         return domain_histories
 
+    def count_by_domain(self) -> typing.Counter[str]:
+        """
+        Returns the number of histories/bookmarks for each domain-name, in the
+        same order as :py:meth:`sort_domain` but without grouping the entries.
+
+        Examples:
+
+        >>> from datetime import datetime
+        ... from browser_history import generic
+        ... entries = [
+        ...     (datetime(2020, 1, 1), 'https://google.com', 'Google'),
+        ...     (
+        ...         datetime(2020, 1, 1),
+        ...         "https://google.com/imghp?hl=EN",
+        ...         "Google Images",
+        ...     ),
+        ...     (datetime(2020, 1, 1), 'https://example.com', 'Example'),
+        ... ]
+        ... obj = generic.Outputs('history')
+        ... obj.histories = entries
+        ... obj.count_by_domain()
+        Counter({'google.com': 2, 'example.com': 1})
+        """
+        # count each URL first so that every distinct URL is parsed once
+        url_counts = Counter(entry[1] for entry in self._get_data())
+        domain_counts: typing.Counter[str] = Counter()
+        for url, count in url_counts.items():
+            domain_counts[_netloc(url)] += count
+        return domain_counts
+
     def formatted(self, output_format: str = "csv") -> str:
         """
         Returns history or bookmarks as a :py:class:`str` formatted as
@@ -481,18 +762,21 @@ class Outputs:
 
         :param output_format: One the formats in `csv`, `json`, `jsonl`
         """
-        # convert to lower case since the formats tuple is enforced in
-        # lowercase
-        output_format = output_format.lower()
-        if self.format_map.get(output_format):
-            # fetch the required formatter and call it. The formatters are
-            # instance methods so no need to pass any arguments
-            formatter = self.format_map[output_format]
-            return formatter()
-        raise ValueError(
-            f"Invalid format {output_format}. Should be one of \
-            {self.format_map.keys()}"
-        )
+        writer = self._get_writer(output_format)
+        with StringIO() as output:
+            writer(output)
+            return output.getvalue()
+
+    def _get_writer(self, output_format: str) -> Callable:
+        """Return the function writing ``output_format`` to a file object."""
+        # convert to lower case since the formats are enforced in lowercase
+        writer = self._writer_map.get(output_format.lower())
+        if writer is None:
+            raise ValueError(
+                f"Invalid format {output_format}. Should be one of "
+                f"{', '.join(self._writer_map)}"
+            )
+        return writer
 
     def to_csv(self) -> str:
         """
@@ -517,18 +801,16 @@ class Outputs:
         2020-01-01 00:00:00,https://example.com,Example Domain
 
         """
+        return self.formatted("csv")
+
+    def _write_csv(self, out_file):
+        """Write history or bookmarks in CSV format to the file object ``out_file``."""
         # we will use csv module and let it do all the heavy lifting such as
         # special character escaping and correct line termination escape
         # sequences
-        # The catch is, we need to return a string but the csv module only
-        # works with files so we will use StringIO to build the csv in
-        # memory first
-        with StringIO() as output:
-            writer = csv.writer(output)
-            writer.writerow(self._get_fields())
-            for row in self._get_data():
-                writer.writerow(row)
-            return output.getvalue()
+        writer = csv.writer(out_file)
+        writer.writerow(self._get_fields())
+        writer.writerows(self._get_data())
 
     def to_json(self, json_lines: bool = False) -> str:
         """
@@ -577,36 +859,32 @@ class Outputs:
             ]
         }
         """
-
-        # custom json encoder for datetime objects
-        class DateTimeEncoder(json.JSONEncoder):
-            """Custom JSON encoder to encode datetime objects"""
-
-            # Override the default method
-            def default(self, o):
-                if isinstance(o, (datetime.date, datetime.datetime)):
-                    return o.isoformat()
-                # skip coverage for this line (tested but not detected)
-                return super().default(o)  # pragma: no cover
-
-        # fetch lines
-        lines = []
-        for entry in self._get_data():
-            json_record = {}
-            for field, value in zip(self._get_fields(), entry):
-                json_record[field] = value
-            lines.append(json_record)
+        return self.formatted("jsonl" if json_lines else "json")
+
+    def _write_json(self, out_file, json_lines: bool = False):
+        """Write history or bookmarks in JSON or JSON Lines format to the file
+        object ``out_file``."""
+
+        # fetch lines, with datetimes converted to ISO strings here rather than
+        # in a JSONEncoder.default override, which is slow with indent=4
+        fields = self._get_fields()
+        lines = (
+            {
+                field: value.isoformat() if isinstance(value, datetime.date) else value
+                for field, value in zip(fields, entry)
+            }
+            for entry in self._get_data()
+        )
 
         if json_lines:
-            json_string = "\n".join(
-                [json.dumps(line, cls=DateTimeEncoder) for line in lines]
-            )
+            # json.dumps would create a new encoder for every line
+            encode = json.JSONEncoder().encode
+            for i, line in enumerate(lines):
+                if i:
+                    out_file.write("\n")
+                out_file.write(encode(line))
         else:
-            json_string = json.dumps(
-                {self.fetch_type: lines}, cls=DateTimeEncoder, indent=4
-            )
-
-        return json_string
+            json.dump({self.fetch_type: list(lines)}, out_file, indent=4)
 
     def save(self, filename, output_format="infer"):
         """
@@ -614,6 +892,9 @@ class Outputs:
         filename extension. If the type could not be inferred, it defaults
         to csv.
 
+        CSV and JSON Lines output is written to the file one row at a time
+        instead of being built in memory first.
+
         :param filename: the name of the file.
         :param output_format: (optional)One the formats in `csv`, `json`,
             `jsonl`.
@@ -622,14 +903,17 @@ class Outputs:
         """
         if output_format == "infer":
             output_format = os.path.splitext(filename)[1][1:]
-            if output_format not in self.format_map:
+            if output_format not in self._writer_map:
                 raise ValueError(
                     f"Invalid extension .{output_format}. Should be one of "
-                    f"{', '.join(self.format_map.keys())}"
+                    f"{', '.join(self._writer_map)}"
                 )
 
-        with open(filename, "w") as out_file:
-            out_file.write(self.formatted(output_format))
+        writer = self._get_writer(output_format)
+        # newline="" lets the csv module write its own line terminators; JSON
+        # output is written with "\n" line endings on every platform
+        with open(filename, "w", newline="") as out_file:
+            writer(out_file)
 
 
 class ChromiumBasedBrowser(Browser, abc.ABC):
@@ -644,9 +928,7 @@ class ChromiumBasedBrowser(Browser, abc.ABC):
 
     history_SQL = """
             SELECT
-                datetime(
-                    visits.visit_time/1000000-11644473600, 'unixepoch', 'localtime'
-                ) as 'visit_time',
+                visits.visit_time/1000000-11644473600 as 'visit_time',
                 urls.url,
                 urls.title
             FROM
@@ -668,43 +950,39 @@ class ChromiumBasedBrowser(Browser, abc.ABC):
         :rtype: list(tuple(:py:class:`datetime.datetime`, str, str, str))
         """
 
-        def _deeper(bookmarks_json, folder, bookmarks_list):
-            for node in bookmarks_json:
-                if node == "children":
-                    for child in bookmarks_json[node]:
-                        if child["type"] == "url":
-                            d_t = datetime.datetime(
-                                1601, 1, 1, tzinfo=datetime.timezone.utc
-                            ) + datetime.timedelta(
-                                microseconds=int(child["date_added"])
-                            )
-                            bookmarks_list.append(
-                                (
-                                    d_t.replace(microsecond=0).astimezone(
-                                        self._local_tz
-                                    ),
-                                    child["url"],
-                                    child["name"],
-                                    folder,
-                                )
-                            )
-                        elif child["type"] == "folder":
-                            bookmarks_list = _deeper(
-                                child,
-                                folder + os.sep + child["name"],
-                                bookmarks_list,
-                            )
-                    break
-                else:
-                    bookmarks_list = _deeper(
-                        bookmarks_json[node], folder, bookmarks_list
-                    )
-            return bookmarks_list
-
+        local_tz = self._local_tz
         with open(bookmark_path, "rb") as b_p:
-            b_m = json.load(b_p)
-            bookmarks_list = []
-            for root in b_m["roots"]:
-                if isinstance(b_m["roots"][root], dict):
-                    bookmarks_list = _deeper(b_m["roots"][root], root, bookmarks_list)
+            roots = json.load(b_p)["roots"]
+        bookmarks_list = []
+        # Walked with an explicit stack, in the order the bookmarks appear in
+        # the file. Children are pushed in reverse so they are popped in order.
+        stack = [
+            (roots[root], root)
+            for root in reversed(list(roots))
+            if isinstance(roots[root], dict)
+        ]
+        while stack:
+            node, folder = stack.pop()
+            if node.get("type") == "url":
+                bookmarks_list.append(
+                    (
+                        _webkit_to_datetime(node["date_added"], local_tz),
+                        node["url"],
+                        node["name"],
+                        folder,
+                    )
+                )
+            elif "children" in node:
+                for child in reversed(node["children"]):
+                    if child["type"] == "url":
+                        stack.append((child, folder))
+                    elif child["type"] == "folder":
+                        stack.append((child, folder + os.sep + child["name"]))
+            else:
+                # folders can be nested under other keys of a root
+                stack.extend(
+                    (value, folder)
+                    for value in reversed(list(node.values()))
+                    if isinstance(value, dict)
+                )
         return bookmarks_list
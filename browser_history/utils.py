@@ -41,19 +41,29 @@ class Platform(enum.Enum):
     WINDOWS = 3
 
 
+_SYSTEM_PLATFORMS = {
+    "Linux": Platform.LINUX,
+    "Darwin": Platform.MAC,
+    "Windows": Platform.WINDOWS,
+}
+
+_PLATFORM_NAMES = {
+    Platform.LINUX: "Linux",
+    Platform.WINDOWS: "Windows",
+    Platform.MAC: "MacOS",
+}
+
+
 def get_platform():
     """Returns the current platform
 
     :rtype: :py:class:`Platform`
     """
     system = platform.system()
-    if system == "Linux":
-        return Platform.LINUX
-    if system == "Darwin":
-        return Platform.MAC
-    if system == "Windows":
-        return Platform.WINDOWS
-    raise NotImplementedError(f"Platform {system} is not supported yet")
+    try:
+        return _SYSTEM_PLATFORMS[system]
+    except KeyError:
+        raise NotImplementedError(f"Platform {system} is not supported yet") from None
 
 
 def get_platform_name(plat: Optional[Platform] = None) -> str:
@@ -61,13 +71,7 @@ def get_platform_name(plat: Optional[Platform] = None) -> str:
     if plat is None:
         plat = get_platform()
 
-    if plat == Platform.LINUX:
-        return "Linux"
-    if plat == Platform.WINDOWS:
-        return "Windows"
-    if plat == Platform.MAC:
-        return "MacOS"
-    return "Unknown"
+    return _PLATFORM_NAMES.get(plat, "Unknown")
 
 
 def get_browsers():
@@ -108,17 +112,19 @@ def _default_browser_linux():
     return default
 
 
+_WIN_DEFAULT_BROWSER_KEY = (
+    "Software\\Microsoft\\Windows\\Shell\\Associations\\"
+    "UrlAssociations\\https\\UserChoice"
+)
+
+
 def _default_browser_win():
-    if get_platform() == Platform.WINDOWS:
-        try:
-            import winreg
-        except ModuleNotFoundError:
-            winreg = None
-    reg_path = (
-        "Software\\Microsoft\\Windows\\Shell\\Associations\\"
-        "UrlAssociations\\https\\UserChoice"
-    )
-    with winreg.OpenKey(winreg.HKEY_CURRENT_USER, reg_path) as key:
+    try:
+        import winreg
+    except ModuleNotFoundError:
+        logger.warning("Could not determine default browser")
+        return None
+    with winreg.OpenKey(winreg.HKEY_CURRENT_USER, _WIN_DEFAULT_BROWSER_KEY) as key:
         default = winreg.QueryValueEx(key, "ProgId")
         if default is None:
             logger.warning("Could not determine default browser")
@@ -194,8 +200,9 @@ def get_browser(browser_name):
         return default_browser()
     else:
         browser_class = None
+        name = browser_name.lower()
         for browser in get_browsers():
-            if browser.__name__.lower() == browser_name.lower():
+            if browser.__name__.lower() == name:
                 if browser.is_supported():
                     browser_class = browser
                     break
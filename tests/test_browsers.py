@@ -751,3 +751,17 @@ def test_epic_mac(become_mac, change_homedir):  # noqa: F811
             "bookmark_bar",
         ),
     )
+
+
+def test_get_history_all_browsers(become_linux, change_homedir):  # noqa: F811
+    expected = []
+    for browser_class in browser_history.utils.get_browsers():
+        if browser_class.linux_path is not None:
+            expected.extend(browser_class().fetch_history().histories)
+    assert len({h[1] for h in expected}) > 1
+
+    out = browser_history.get_history()
+
+    assert out.histories == sorted(
+        expected, key=browser_history.generic._history_sort_key
+    )
@@ -4,8 +4,10 @@
 """test for generic module."""
 import os
 import pathlib
-from datetime import datetime
+import sqlite3
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch, Mock
+from urllib.parse import urlparse
 
 import pytest
 from browser_history import generic, utils
@@ -81,6 +83,45 @@ def test_output_sort_domain(entries, exp_res):
     assert list(obj.sort_domain().items()) == exp_res
 
 
+def test_output_count_by_domain():
+    """test Outputs.count_by_domain"""
+    obj = generic.Outputs("history")
+    obj.histories = [
+        [datetime(2020, 1, 1), "https://google.com"],
+        [datetime(2020, 1, 1), "https://example.com"],
+        [datetime(2020, 1, 2), "https://google.com/imghp?hl=EN"],
+        [datetime(2020, 1, 3), "https://google.com"],
+    ]
+    counts = obj.count_by_domain()
+    assert list(counts.items()) == [("google.com", 3), ("example.com", 1)]
+    assert counts == {
+        domain: len(entries) for domain, entries in obj.sort_domain().items()
+    }
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://google.com",
+        "https://user:pw@google.com:443/search?q=a#top",
+        "HTTP://Example.COM?q=1",
+        "file:///home/user/page.html",
+        "chrome://settings/",
+        "about:blank",
+        "javascript:alert('http://example.com')",
+        "//example.com/path",
+        " https://example.com/",
+        "ht\ttps://example.com/",
+        "https://exa\tmple.com/",
+        "https://[::1]:8080/",
+        "https://bücher.de/",
+        "",
+    ],
+)
+def test_netloc_matches_urlparse(url):
+    assert generic._netloc(url) == urlparse(url).netloc
+
+
 def test_outputs_invalid_fetch_type():
     """Check that there's an error raised when an invalid fetch_type is used."""
     obj = generic.Outputs("history")
@@ -120,19 +161,55 @@ def test_browser_unknown_platform():
         _CustomBrowser(utils.Platform.OTHER)
 
 
-def test_browser_profiles_remove_trailing_separator():
+def test_browser_profiles_remove_trailing_separator(tmp_path):
     browser = _CustomBrowser(utils.Platform.LINUX)
-    browser.history_file = "history/"
-    profile_filename = f"profile.file{os.sep}"
-    mocked_os = Mock()
-    mocked_os.walk.return_value = [
-        [f"history/{profile_filename}", "dirname", [profile_filename]]
-    ]
-    mocked_os.path.split.return_value = [profile_filename]
-    mocked_os.sep = os.sep
-    with patch("browser_history.generic.os", mocked_os):
-        trimmed_path = browser.profiles(profile_filename)[0]
-    assert trimmed_path == f"{browser.history_file}{profile_filename}"[:-1]
+    browser.history_dir = tmp_path
+    (tmp_path / "profile" / "nested").mkdir(parents=True)
+    (tmp_path / "profile" / "nested" / "profile.file").touch()
+    assert browser.profiles("profile.file") == [os.path.join("profile", "nested")]
+
+
+def test_browser_profiles_only_searches_prefixed_dirs(tmp_path):
+    browser = _CustomBrowser(utils.Platform.LINUX)
+    browser.history_dir = tmp_path
+    browser.profile_dir_prefixes = ["Default*", "Profile*"]
+    for profile_dir in ("Default", "Profile 1", "Cache", "Default/Cache"):
+        (tmp_path / profile_dir).mkdir()
+        (tmp_path / profile_dir / "History").touch()
+    (tmp_path / "History").touch()
+    profiles = browser.profiles("History")
+    assert profiles[0] == ""
+    assert sorted(profiles) == ["", "Default", "Profile 1"]
+
+
+def test_browser_profiles_cached_until_invalidated(tmp_path):
+    browser = _CustomBrowser(utils.Platform.LINUX)
+    browser.history_dir = tmp_path
+    (tmp_path / "group" / "first").mkdir(parents=True)
+    (tmp_path / "group" / "first" / "History").touch()
+    first = os.path.join("group", "first")
+    assert browser.profiles("History") == [first]
+
+    # does not change the modification time of the browser directory
+    (tmp_path / "group" / "second").mkdir()
+    (tmp_path / "group" / "second" / "History").touch()
+    assert browser.profiles("History") == [first]
+    browser.invalidate_profiles_cache()
+    second = os.path.join("group", "second")
+    assert sorted(browser.profiles("History")) == [first, second]
+
+    (tmp_path / "third").mkdir()
+    (tmp_path / "third" / "History").touch()
+    assert browser.profiles("History") == ["third"]
+
+
+def test_browser_profiles_not_searched_below_top_level_profiles(tmp_path):
+    browser = _CustomBrowser(utils.Platform.LINUX)
+    browser.history_dir = tmp_path
+    (tmp_path / "profile" / "cache").mkdir(parents=True)
+    (tmp_path / "profile" / "History").touch()
+    (tmp_path / "profile" / "cache" / "History").touch()
+    assert browser.profiles("History") == ["profile"]
 
 
 def test_browser_history_path_profile_is_none():
@@ -199,3 +276,161 @@ def test_chromium_based_browser_bookmark_parser_deep_hierarchy():
         with patch("browser_history.generic.json.load", Mock(return_value=nodes)):
             bookmark_list = browser.bookmarks_parser("/")
     assert len(bookmark_list) == 1
+
+
+def test_chromium_based_browser_bookmark_parser_keeps_file_order():
+    class CustomChromiumBrowser(ChromiumBasedBrowser):
+        name = "Test"
+        linux_path = "random_path"
+
+    def url(name):
+        return {"type": "url", "date_added": "0", "url": name, "name": name}
+
+    browser = CustomChromiumBrowser(utils.Platform.LINUX)
+    nodes = {
+        "roots": {
+            "bar": {
+                "children": [
+                    url("a"),
+                    {"type": "folder", "name": "sub", "children": [url("b")]},
+                    url("c"),
+                ]
+            },
+            "other": {"children": [url("d")]},
+            "version": 1,
+        }
+    }
+    with patch("browser_history.generic.open"):
+        with patch("browser_history.generic.json.load", Mock(return_value=nodes)):
+            bookmark_list = browser.bookmarks_parser("/")
+    assert [(b[1], b[3]) for b in bookmark_list] == [
+        ("a", "bar"),
+        ("b", os.path.join("bar", "sub")),
+        ("c", "bar"),
+        ("d", "other"),
+    ]
+
+
+@pytest.mark.parametrize("tz", [None, timezone(timedelta(hours=5, minutes=30))])
+def test_parse_sqlite_ts(tz):
+    assert generic._parse_sqlite_ts("2020-08-03 00:29:04", tz) == datetime(
+        2020, 8, 3, 0, 29, 4, tzinfo=tz
+    )
+
+
+def test_visit_time_to_datetime():
+    tz = timezone(timedelta(hours=5, minutes=30))
+    local = sqlite3.connect(":memory:").execute(
+        "SELECT datetime(1596394744, 'unixepoch', 'localtime')"
+    )
+    expected = generic._parse_sqlite_ts(local.fetchone()[0], tz)
+    assert generic._visit_time_to_datetime(1596394744, tz) == expected
+    assert generic._visit_time_to_datetime(1596394744.0, tz) == expected
+
+
+@pytest.mark.parametrize("timestamp", ["0", "13250000000999999", 13250000000000000])
+def test_webkit_to_datetime(timestamp):
+    tz = timezone(timedelta(hours=5, minutes=30))
+    expected = datetime(1601, 1, 1, tzinfo=timezone.utc) + timedelta(
+        microseconds=int(timestamp)
+    )
+    assert generic._webkit_to_datetime(timestamp, tz) == expected.replace(microsecond=0)
+    assert generic._webkit_to_datetime(timestamp, tz).tzinfo is tz
+
+
+@pytest.mark.parametrize("output_format", ["csv", "json", "jsonl"])
+def test_outputs_save_matches_formatted(tmp_path, output_format):
+    outputs = Outputs("history")
+    outputs.histories.extend(
+        [
+            (datetime(2020, 1, 1), "https://google.com", "Google"),
+            (datetime(2020, 1, 2), "https://example.com", None),
+        ]
+    )
+    filename = tmp_path / f"history.{output_format}"
+    outputs.save(str(filename))
+    with open(filename, newline="") as saved:
+        assert saved.read() == outputs.formatted(output_format)
+
+
+def test_sqlite_snapshot(tmp_path):
+    # "#" would end the path if it was not escaped in the URI
+    profile_dir = tmp_path / "profile #1"
+    profile_dir.mkdir()
+    db_path = profile_dir / "History"
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE urls (url TEXT)")
+    conn.execute("INSERT INTO urls VALUES ('https://example.com')")
+    conn.commit()
+    conn.execute("PRAGMA wal_checkpoint")
+    # a running browser holds an exclusive lock on its database
+    conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+    conn.execute("BEGIN EXCLUSIVE")
+    files_before = set(profile_dir.iterdir())
+
+    with patch("browser_history.generic.shutil.copy2") as copy2:
+        snapshot = generic._sqlite_snapshot(db_path)
+    assert snapshot.execute("SELECT url FROM urls").fetchall() == [
+        ("https://example.com",)
+    ]
+    snapshot.close()
+
+    # read in place: nothing copied and no files created next to the database
+    copy2.assert_not_called()
+    assert set(profile_dir.iterdir()) == files_before
+    conn.close()
+
+
+def test_sqlite_snapshot_unreadable_falls_back_to_copy(tmp_path):
+    db_path = tmp_path / "History"
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA wal_autocheckpoint=0")
+    conn.execute("CREATE TABLE urls (url TEXT)")
+    conn.execute("INSERT INTO urls VALUES ('https://example.com')")
+    conn.commit()
+
+    connect = sqlite3.connect
+
+    def fail_in_place(database, *args, **kwargs):
+        if str(database).endswith("immutable=1"):
+            raise sqlite3.OperationalError("unable to open database file")
+        return connect(database, *args, **kwargs)
+
+    with patch("browser_history.generic.sqlite3.connect", fail_in_place):
+        snapshot = generic._sqlite_snapshot(db_path)
+    # the copied -wal file is read too
+    assert snapshot.execute("SELECT url FROM urls").fetchall() == [
+        ("https://example.com",)
+    ]
+    snapshot.close()
+    conn.close()
+
+
+def test_sqlite_snapshot_empty_file(tmp_path):
+    db_path = tmp_path / "History"
+    db_path.touch()
+    assert generic._sqlite_snapshot(db_path) is None
+
+
+def test_browser_local_tz_resolved_per_instance():
+    first_tz = timezone(timedelta(hours=1))
+    second_tz = timezone(timedelta(hours=2))
+    mocked_datetime = Mock(wraps=generic.datetime.datetime)
+    mocked_datetime.now.return_value.astimezone.return_value.tzinfo = first_tz
+    with patch("browser_history.generic.datetime.datetime", mocked_datetime):
+        first = _CustomBrowser(utils.Platform.LINUX)
+        mocked_datetime.now.return_value.astimezone.return_value.tzinfo = second_tz
+        second = _CustomBrowser(utils.Platform.LINUX)
+    assert first._local_tz is first_tz
+    assert second._local_tz is second_tz
+
+
+def test_browser_local_tz_set_by_subclass_is_kept():
+    tz = timezone(timedelta(hours=-3))
+
+    class _FixedTzBrowser(_CustomBrowser):
+        _local_tz = tz
+
+    assert _FixedTzBrowser(utils.Platform.LINUX)._local_tz is tz
@@ -44,6 +44,10 @@ def test_platform_name_win(become_windows):  # noqa: F811
     assert get_platform_name() == "Windows"
 
 
+def test_platform_name_other():
+    assert get_platform_name(Platform.OTHER) == "Unknown"
+
+
 def test_platform_name_unknown(become_unknown):  # noqa: F811
     with pytest.raises(NotImplementedError):
         get_platform_name()
@@ -83,6 +87,12 @@ def test__default_browser_win_key_is_empty(become_windows):  # noqa: F811
     assert default is None
 
 
+def test__default_browser_win_no_winreg():
+    with patch.dict(sys.modules, {"winreg": None}):
+        default = _default_browser_win()
+    assert default is None
+
+
 def test_default_browser_firefox_noisy_alias(become_windows):  # noqa: F811
     mocked_dbw = Mock()
     mocked_dbw.return_value = "garbage_firefoxurl"